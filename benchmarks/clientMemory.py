@@ -0,0 +1,134 @@
+# Logs in once per memory profile and reports resident memory per 10k cached members.
+# Each profile runs in its own interpreter so the numbers don't leak into each other.
+# Usage, from the repository root:  python benchmarks/clientMemory.py [profile ...]
+#
+# --replay [members] [online share] needs no token. It feeds one large guild to
+# discord.py's connection state the way the gateway would: a GUILD_CREATE with the
+# online members and their presences, then every member when the profile chunks at
+# startup. Memory is reported per 10k members of the guild, not of the cache: the
+# Python heap the cache holds, and resident memory from a second run without tracing,
+# which also counts the payloads being parsed, so it's an upper bound.
+#         python benchmarks/clientMemory.py --replay 50000 0.15
+
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+
+source = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, source)
+
+def residentMemory():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        # Peak rather than current, but nothing is freed during the measurement
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(profile, settle):
+    import discord
+    from botkey import Key
+    from clientProfile import ClientProfile
+
+    baseline = residentMemory()
+    client = discord.Client(**ClientProfile.options(profile))
+    result = {}
+
+    @client.event
+    async def on_ready():
+        # Give chunking and the first presence updates some time to arrive
+        await asyncio.sleep(settle)
+        gc.collect()
+        result['members'] = sum(len(guild.members) for guild in client.guilds)
+        result['guilds'] = len(client.guilds)
+        result['messages'] = len(client.cached_messages)
+        result['rss'] = residentMemory() - baseline
+        await client.close()
+
+    client.run(Key().value())
+    print(json.dumps(result))
+
+def memberData(i, roles, rnd):
+    return {
+        'user': { 'id': str(10**17 + i), 'username': 'member{0}'.format(i), 'discriminator': '{0:04d}'.format(i % 10000), 'avatar': '0' * 32 },
+        'roles': [ role['id'] for role in rnd.sample(roles, 3) ],
+        'joined_at': '2019-01-01T00:00:00+00:00', 'nick': None, 'deaf': False, 'mute': False
+    }
+
+def replay(profile, members, online, trace):
+    import discord
+    from clientProfile import ClientProfile
+
+    rnd = random.Random(1)
+    roles = [ { 'id': str(900 + i), 'name': 'Role{0}'.format(i), 'permissions': '0', 'position': i, 'color': 0,
+                'hoist': False, 'managed': False, 'mentionable': False } for i in range(20) ]
+    everyone = [ memberData(i, roles, rnd) for i in range(members) ]
+    online = everyone[:int(members * online)]
+    presences = [ { 'user': { 'id': data['user']['id'] }, 'status': 'online', 'client_status': { 'desktop': 'online' },
+                    'activities': [ { 'name': 'Game', 'type': 0 } ] } for data in online ]
+    # The gateway only sends presences with the intent
+    if not ClientProfile.profiles[profile]['presences']:
+        presences = []
+    guildCreate = json.dumps({ 'id': '1', 'name': 'replay', 'roles': roles, 'channels': [], 'emojis': [], 'features': [],
+                               'members': online, 'presences': presences, 'member_count': members, 'large': True })
+    chunk = json.dumps(everyone)
+    del everyone, online, presences
+
+    client = discord.Client(**ClientProfile.options(profile))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data={ 'id': '5', 'username': 'bot', 'discriminator': '0001', 'avatar': None })
+
+    gc.collect()
+    baseline = residentMemory()
+    if trace:
+        tracemalloc.start()
+    guild = state._add_guild_from_data(json.loads(guildCreate))
+    # What the startup chunk requests add
+    if state._chunk_guilds:
+        for data in json.loads(chunk):
+            guild._add_member(discord.Member(data=data, guild=guild, state=state))
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] if trace else 0
+
+    print(json.dumps({ 'members': members, 'cached': len(guild.members), 'traced': traced, 'rss': residentMemory() - baseline }))
+
+def replayAll(members, online):
+    print('{0} members, {1:.0f}% online'.format(members, online * 100))
+    print('{0:<8} {1:>9} {2:>16} {3:>14}'.format('profile', 'cached', 'heap MB per 10k', 'rss MB per 10k'))
+    for profile in [ 'full', 'lean', 'minimal' ]:
+        results = []
+        for trace in [ '1', '0' ]:
+            output = subprocess.run([ sys.executable, __file__, '--replay-one', profile, str(members), str(online), trace ],
+                                    cwd=source, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        perTenK = 10000 / members / 2**20
+        print('{0:<8} {1:>9} {2:>16.2f} {3:>14.2f}'.format(profile, results[0]['cached'], results[0]['traced'] * perTenK, results[1]['rss'] * perTenK))
+
+def main():
+    profiles = sys.argv[1:] or [ 'full', 'lean', 'minimal' ]
+    settle = 60
+
+    print('{0:<8} {1:>7} {2:>9} {3:>9} {4:>12}'.format('profile', 'guilds', 'members', 'rss MB', 'MB per 10k'))
+    for profile in profiles:
+        output = subprocess.run([ sys.executable, __file__, '--measure', profile, str(settle) ],
+                                cwd=source, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        megabytes = result['rss'] / 2**20
+        perTenK = megabytes / result['members'] * 10000 if result['members'] else 0
+        print('{0:<8} {1:>7} {2:>9} {3:>9.1f} {4:>12.1f}'.format(profile, result['guilds'], result['members'], megabytes, perTenK))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], int(sys.argv[3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == '--replay-one':
+        replay(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), sys.argv[5] == '1')
+    elif len(sys.argv) > 1 and sys.argv[1] == '--replay':
+        replayAll(int(sys.argv[2]) if len(sys.argv) > 2 else 50000, float(sys.argv[3]) if len(sys.argv) > 3 else 0.15)
+    else:
+        main()
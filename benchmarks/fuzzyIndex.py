@@ -0,0 +1,77 @@
+# Times FuzzyIndex.closest on synthetic command names. The first dictionary only uses the
+# real dictionary's words, so every trigram is shared by hundreds of names, which is the
+# slowest case. The second draws from a vocabulary that grows with the dictionary, as a
+# real one would. Queries are names with one typo, names with two words swapped, and
+# random text that matches nothing.
+# Usage, from the repository root:  python benchmarks/fuzzyIndex.py [names] [queries]
+
+import json
+import os
+import random
+import string
+import sys
+import time
+
+source = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, source)
+
+from fuzzyIndex import FuzzyIndex
+
+def typo(name, rnd):
+    i = rnd.randrange(len(name))
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return name[:i] + rnd.choice(string.ascii_lowercase) + name[i + 1:]
+    if kind == 1:
+        return name[:i] + name[i + 1:]
+    return name[:i] + rnd.choice(string.ascii_lowercase) + name[i:]
+
+def generated(count, rnd):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 12))))
+    return sorted(words)
+
+def dictionary(vocabulary, count, rnd):
+    names = set()
+    while len(names) < count:
+        names.add(' '.join(rnd.choice(vocabulary) for _ in range(rnd.randint(1, 3))) + ('' if rnd.random() < 0.5 else str(rnd.randrange(100))))
+    return sorted(names)
+
+def measure(names, queries, rnd):
+    index = FuzzyIndex(names)
+    cases = {
+        'typo': [ typo(rnd.choice(names), rnd) for _ in range(queries) ],
+        'swapped': [ ' '.join(reversed(name.split(' '))) for name in rnd.sample(names, queries) ],
+        'no match': [ ''.join(rnd.choice(string.ascii_lowercase + ' ') for _ in range(rnd.randint(4, 20))) for _ in range(queries) ]
+    }
+
+    print('{0:<10} {1:>8} {2:>8} {3:>8} {4:>8}'.format('queries', 'avg ms', 'p99 ms', 'max ms', 'found'))
+    for case, words in cases.items():
+        times = []
+        found = 0
+        for word in words:
+            started = time.perf_counter()
+            found += index.closest(word) is not None
+            times.append(time.perf_counter() - started)
+        times.sort()
+        print('{0:<10} {1:>8.3f} {2:>8.3f} {3:>8.3f} {4:>8}'.format(
+            case, sum(times) / len(times) * 1000, times[int(len(times) * 0.99) - 1] * 1000, times[-1] * 1000, found))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rnd = random.Random(1)
+
+    with open(os.path.join(source, 'dictEntries.txt'), 'r') as f:
+        keys = list(json.loads(f.read()))
+    vocabulary = sorted(set(word.lower() for key in keys for word in key.split('.')))
+
+    print('{0} names from the dictionary\'s {1} words'.format(count, len(vocabulary)))
+    measure(dictionary(vocabulary, count, rnd), queries, rnd)
+    print()
+    print('{0} names from {1} generated words'.format(count, count // 2))
+    measure(dictionary(generated(count // 2, rnd), count, rnd), queries, rnd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Simulates events from many guilds against the per guild config store.
+# Usage, from the repository root:  python benchmarks/guildConfigLoad.py [guilds] [events]
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+source = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, source)
+
+from dict import DictionaryReader
+from guildConfig import GuildConfig
+
+def main():
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(source, 'dictEntries.txt'), workdir)
+    os.chdir(workdir)
+
+    # Every guild gets its own channels and roles, half of them override a command text too
+    guildIds = [ 100000000000000000 + i for i in range(guilds) ]
+    for guildId in guildIds:
+        GuildConfig.set(guildId, 'actionLogChannel', str(guildId + 1))
+        GuildConfig.set(guildId, 'streamingChannels', str(guildId + 2))
+        GuildConfig.set(guildId, 'subscriptionchannel', str(guildId + 3))
+        GuildConfig.set(guildId, 'roles', 'Staff {0}'.format(guildId))
+        if guildId % 2:
+            GuildConfig.set(guildId, 'shame', 'Guild {0} shame'.format(guildId))
+
+    random.seed(1)
+    order = [ random.choice(guildIds) for i in range(events) ]
+
+    started = time.perf_counter()
+    for guildId in order:
+        p = DictionaryReader(guildId)
+        assert p.actionLogChannel() == str(guildId + 1)
+        p.roles()
+        p.streamingBroadcastChannel()
+        p.commandReader('shame')
+    elapsed = time.perf_counter() - started
+
+    print('{0} guilds, {1} events'.format(guilds, events))
+    print('{0:.1f}us per event, {1:.0f} events/s'.format(elapsed / events * 1e6, events / elapsed))
+    print('{0} guilds cached'.format(len(GuildConfig.cache)))
+
+    shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
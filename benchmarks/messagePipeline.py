@@ -0,0 +1,79 @@
+# Compares the old serial on_message flow with MessagePipeline using stubbed Discord sends.
+# Usage, from the repository root:  python benchmarks/messagePipeline.py [messages] [seconds between messages]
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from messagePipeline import MessagePipeline
+
+# Simulated round trips, the report channel being slower than the reply
+reportLatency = 0.120
+replyLatency = 0.040
+reactionLatency = 0.060
+
+async def send(latency):
+    await asyncio.sleep(latency)
+
+# One message in ten lands in the H2P log channel and gets reactions
+async def serial(i, replies):
+    arrived = time.perf_counter()
+    if i % 10 == 0:
+        await send(reactionLatency)
+    await send(reportLatency)
+    await send(replyLatency)
+    replies.append(time.perf_counter() - arrived)
+
+async def pipelined(i, pipeline, replies):
+    arrived = time.perf_counter()
+    if i % 10 == 0:
+        pipeline.spawn('reactions', send(reactionLatency))
+
+    async def handler():
+        pipeline.spawn('report', send(reportLatency))
+        await send(replyLatency)
+
+    await pipeline.run('command', handler())
+    replies.append(time.perf_counter() - arrived)
+
+# discord.py dispatches every event as its own task, messages arrive every `gap` seconds
+async def simulate(handler, messages, gap):
+    tasks = []
+    for i in range(messages):
+        tasks.append(asyncio.ensure_future(handler(i)))
+        await asyncio.sleep(gap)
+    await asyncio.gather(*tasks)
+
+def summary(name, replies, elapsed, drained):
+    replies = sorted(replies)
+    print('{0:<10} {1:>8.1f} {2:>8.1f} {3:>10.2f} {4:>10.2f}'.format(
+        name, statistics.median(replies) * 1000, replies[int(len(replies) * 0.99) - 1] * 1000, elapsed, drained))
+
+async def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    gap = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+
+    # replies s: until the last reply is sent, drained s: until the background work is done too
+    print('{0:<10} {1:>8} {2:>8} {3:>10} {4:>10}'.format('flow', 'p50 ms', 'p99 ms', 'replies s', 'drained s'))
+
+    replies = []
+    started = time.perf_counter()
+    await simulate(lambda i: serial(i, replies), messages, gap)
+    elapsed = time.perf_counter() - started
+    summary('serial', replies, elapsed, elapsed)
+
+    pipeline = MessagePipeline()
+    replies = []
+    started = time.perf_counter()
+    await simulate(lambda i: pipelined(i, pipeline, replies), messages, gap)
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*[ task for stage in pipeline.pending.values() for task in stage ])
+    summary('pipeline', replies, elapsed, time.perf_counter() - started)
+    print(pipeline.report())
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
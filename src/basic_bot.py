@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from startupHandler import StartupHandler
 import discord
 from discord import Forbidden
 #from discord.ext import commands
@@ -8,56 +9,118 @@ from dict import DictionaryReader
 from botkey import Key
 from subprocess import call
 import sys
-from priestLogger import PriestLogger
+from moderationWorker import ModerationWorker
+from raidDetector import RaidDetector
 from perspectiveHandler import PerspectiveHandler
 import logging
+import asyncio
 import time
 from discord import HTTPException
 from discord import utils
 from discord import DMChannel
 from roleHandler import RoleHandler
+from clientProfile import ClientProfile
+from reloadHandler import ReloadHandler
+from messagePipeline import MessagePipeline
+from profileHandler import ProfileHandler
+from guildConfig import GuildConfig
+import json
 
 logging.basicConfig(level=logging.INFO)
 
-client = discord.Client()
+client = discord.Client(**ClientProfile.options(DictionaryReader().memoryProfile()))
 
 prefix = Key().prefix()
 
-logger = PriestLogger()
+moderation = ModerationWorker()
+
+raids = RaidDetector(prefix)
+
+pipeline = MessagePipeline()
 
 toxicity = PerspectiveHandler()
 
+started = False
+
 @client.event
 async def on_ready():
+    global started
     print('Logged in as')
     print(client.user.name)
     print(client.user.id)
     print('------')
 
+    # on_ready fires again after every reconnect, the background work is started once per process
+    if started:
+        return
+    started = True
+    StartupHandler.markReady()
+    moderation.attach(client)
+    raids.attach(client)
+    client.loop.create_task(reconcileOnStartup())
+    client.loop.create_task(reconcileStreamsPeriodically())
+    client.loop.create_task(StartupHandler.warmup(client))
+
+async def reconcileOnStartup():
+    for guild in client.guilds:
+        try:
+            await RoleHandler.reconcileSubscriptions(client, guild)
+        except (HTTPException, Forbidden):
+            print('Error reconciling subscriptions on {0.name}'.format(guild))
+
+# Presences are needed to tell who is live, without them every holder would look stale
+async def reconcileStreamsPeriodically(interval=900):
+    intents = getattr(client, 'intents', None)
+    if intents is not None and not intents.presences:
+        return
+    while not client.is_closed():
+        for guild in client.guilds:
+            try:
+                removed, deleted = await RoleHandler.reconcileStreams(client, guild)
+                if removed or deleted:
+                    r = DictionaryReader(guild.id)
+                    await client.get_channel(int(r.actionLogChannel())).send('['+time.strftime("%Y-%m-%d %H:%M:%S")+'] Stream reconciliation: removed {0} stale Currently Streaming roles and {1} announcements'.format(removed, deleted))
+            except (HTTPException, Forbidden):
+                print('Error reconciling streams on {0.name}'.format(guild))
+        await asyncio.sleep(interval)
+
 @client.event
 async def on_message(message):
-    r = DictionaryReader()
+    r = DictionaryReader.forGuild(message.guild)
 
     if message.channel.id == int(r.perspectiveLogChannelH2P()):
-        await toxicity.addReactions(r, message)
+        pipeline.spawn('reactions', toxicity.addReactions(r, message))
 
     # we do not want the bot to reply to itself
     if message.author == client.user:
         return
+
+    unscored = raids.message(message.guild.id if message.guild else None, message.author.id, message.content)
+
+    # Only queued here, logging and scoring happen in the moderation worker
+    if isinstance(message.channel, DMChannel) or message.channel.name in r.logChannels():
+        moderation.log(message)
+        if not unscored:
+            moderation.measure(message)
         
     if message.content.startswith(prefix):
-        await messageHandler(message)
-        
-    if isinstance(message.channel, DMChannel) or message.channel.name in r.logChannels():
-        logger.log(message)
-        await toxicity.measure(client, message)    
+        await pipeline.run(commandStage(message), messageHandler(message))
+
+# Admin commands that can take minutes (!profile samples for up to 120s, !update
+# waits for the moderation worker) get their own slots, so replies never wait on them
+adminCommands = ( 'update', 'fullupdate', 'ban', 'info', 'profile', 'startup' )
+
+def commandStage(message):
+    return 'admin' if message.content[len(prefix):].startswith(adminCommands) else 'command'
         
 @client.event
 async def on_message_edit(before, after):
-    logger.logEdit(before, after)    
+    moderation.logEdit(before, after)
     
 @client.event
 async def on_member_join(member):
+    if raids.join(member.guild.id, member.id):
+        return
     await sendWelcomeMessage(member)
     await logAction(member, member.guild, 'joined')
 
@@ -67,7 +130,7 @@ async def on_raw_reaction_add(payload):
     if payload.user_id == client.user.id:
         return
 
-    r = DictionaryReader()
+    r = DictionaryReader(payload.guild_id)
 
     print(r.readEntry('subscriptionchannel',''))
     print(payload.emoji.name)
@@ -80,7 +143,7 @@ async def on_raw_reaction_add(payload):
 
 @client.event
 async def on_raw_reaction_remove(payload):
-    r = DictionaryReader()
+    r = DictionaryReader(payload.guild_id)
 
     if payload.channel_id == int(r.readEntry('subscriptionchannel','')):
         await RoleHandler.newsSubscriptionRemove(client, payload.emoji, payload.user_id, payload.guild_id)
@@ -104,7 +167,7 @@ async def on_member_update(before, after):
     await RoleHandler.toggleUserState(client, before, after)
     
 async def logAction(user, guild, action):
-    r = DictionaryReader()
+    r = DictionaryReader.forGuild(guild)
     if guild:
         await client.get_channel(int(r.actionLogChannel())).send('['+time.strftime("%Y-%m-%d %H:%M:%S")+'] {1.name} - {0.name} {0.mention} ({0.id}) {2}'.format(user, guild, action))
     else:
@@ -112,13 +175,24 @@ async def logAction(user, guild, action):
     #print('error while writing {0} log'.format(action))
     
             
-async def messageHandler(message):
-    p = DictionaryReader()
+async def reportCommand(message):
+    p = DictionaryReader.forGuild(message.guild)
 
     if message.guild:
         await client.get_channel(p.logReportChannel()).send('{0.guild.name} - {0.channel.name} - {0.author} invoked {0.content}'.format(message))
     else:
         await client.get_channel(p.logReportChannel()).send('PM - PM - {0.author} invoked {0.content}'.format(message))
+
+# Keeps the audit trail honest when the report stage was full
+async def reportsDropped(guildId, count):
+    p = DictionaryReader(guildId)
+    await client.get_channel(p.logReportChannel()).send('{0} command reports were dropped while the report stage was full.'.format(count))
+
+pipeline.onDrain('report', reportsDropped)
+
+async def messageHandler(message):
+    # The reply doesn't wait for the report
+    pipeline.spawn('report', reportCommand(message), message.guild.id if message.guild else None)
     
     if message.content.startswith(prefix+'fullupdate') or message.content.startswith(prefix+'update') or message.content.startswith(prefix+'channel'):
         await maintenanceMessages(message)
@@ -139,6 +213,15 @@ async def messageHandler(message):
     elif message.content.startswith(prefix+'ban') or message.content.startswith(prefix+'info'):
         await adminControl(message)
         
+    elif message.content.startswith(prefix+'config'):
+        await guildConfiguration(message)
+
+    elif message.content.startswith(prefix+'profile'):
+        await profileMessage(message)
+
+    elif message.content.startswith(prefix+'startup'):
+        await startupDiagnostics(message)
+
     elif message.content.startswith(prefix+'stream'):
         print('StreamCommand')
         await RoleHandler.toggleStream(client, message)
@@ -148,21 +231,132 @@ async def messageHandler(message):
         await generalMessage(message)
 
 async def maintenanceMessages(message):
-    if message.content.startswith(prefix+'update'):
-        call(["git","pull"])
+    global toxicity
     p = DictionaryReader()
-    if message.content.startswith(prefix+'fullupdate'): 
+    # Pulls and swaps in the new handlers and dictionary, keeping the gateway session
+    if message.content.startswith(prefix+'update'):
+        if str(message.author.id) not in p.admins():
+            await message.channel.send('You\'re not my dad, {0.mention}!'.format(message.author))
+            return
+        reloaded, reply = await ReloadHandler.update()
+        if reloaded:
+            toxicity = PerspectiveHandler()
+            if not await moderation.restart(client.loop):
+                reply += '\nThe moderation worker was still busy after 30s, it will be replaced when it exits.'
+        await message.author.send(reply)
+    # Changes to basic_bot.py itself still need a restart
+    elif message.content.startswith(prefix+'fullupdate'): 
         if str(message.author.id) not in p.admins():
             await message.channel.send('You\'re not my dad, {0.mention}!'.format(message.author))
             return
         call(["git","pull"])
         call(["start_bot.sh"])
+        await pipeline.close()
         sys.exit()
     elif message.content.startswith(prefix+'channel'):
         await message.author.send(str(message.channel.id))
 
-async def forwardMessage(message):
+async def startupDiagnostics(message):
     p = DictionaryReader()
+    if str(message.author.id) not in p.admins():
+        await message.channel.send('You\'re not my dad, {0.mention}!'.format(message.author))
+        return
+    await message.author.send(await StartupHandler.report(client))
+
+def cacheCounts():
+    return {
+        'guilds': len(client.guilds),
+        'members': sum(len(guild.members) for guild in client.guilds),
+        'users': len(client.users),
+        'cached messages': len(client.cached_messages),
+        'dictionary entries': len(DictionaryReader.entries),
+        'fuzzy index words': len(DictionaryReader.index.words) if DictionaryReader.index else 0,
+        'guild configs': len(GuildConfig.cache),
+        'raid author windows': len(raids.authors),
+        'raid floods': len(raids.floods),
+        'raid recent messages': sum(len(recent) for recent in raids.recent.values()),
+        'pipeline pending': sum(len(tasks) for tasks in pipeline.pending.values()),
+        'pipeline dropped': sum(pipeline.dropped.values()),
+        'pipeline failed': sum(pipeline.failed.values())
+    }
+
+# Format:  !profile [seconds] [mem]
+async def profileMessage(message):
+    p = DictionaryReader()
+    if str(message.author.id) not in p.admins():
+        await message.channel.send('You\'re not my dad, {0.mention}!'.format(message.author))
+        return
+
+    command = message.content.split(' ')
+    seconds = int(command[1]) if len(command) > 1 and command[1].isdigit() else 10
+    seconds = max(1, min(seconds, 120))
+    memory = 'mem' in command[2::]
+
+    await message.author.send('Profiling for {0}s{1}'.format(seconds, ' with memory tracing' if memory else ''))
+    for section in await ProfileHandler.profile(client, seconds, memory, cacheCounts()):
+        await message.author.send(section)
+
+# Format:  !config | !config set key value | !config unset key | !config reload
+async def guildConfiguration(message):
+    p = DictionaryReader()
+    if str(message.author.id) not in p.admins():
+        await message.channel.send('You\'re not my dad, {0.mention}!'.format(message.author))
+        return
+    if not message.guild:
+        await message.author.send('Guild settings can only be changed from inside a guild.')
+        return
+
+    command = message.content.split(' ')
+    action = command[1] if len(command) > 1 else ''
+
+    if action == 'set' and len(command) > 3:
+        value = ' '.join(command[3::]).strip()
+        if command[2] in DictionaryReader.processKeys:
+            await message.author.send('{0} applies to every guild and can only be changed in dictEntries.txt'.format(command[2]))
+            return
+        if not value:
+            await message.author.send('Usage: {0}config set key value, or {0}config unset key to use the default'.format(prefix))
+            return
+        # Lists like perspectiveReactions are given as JSON, everything else is kept as text
+        try:
+            value = json.loads(value) if value[0] in '[{' else value
+        except ValueError:
+            pass
+        GuildConfig.set(message.guild.id, command[2], value)
+        await message.author.send('{0} set for {1.name}'.format(command[2], message.guild))
+    elif action == 'unset' and len(command) > 2:
+        GuildConfig.set(message.guild.id, command[2], None)
+        await message.author.send('{0} reset to the default for {1.name}'.format(command[2], message.guild))
+    elif action == 'reload':
+        GuildConfig.invalidate(message.guild.id)
+        await message.author.send('Settings reloaded for {0.name}'.format(message.guild))
+    else:
+        dump = json.dumps(GuildConfig.overrides(message.guild.id), indent=2)
+        await message.author.send('Settings for {0.name}'.format(message.guild))
+        for block in codeBlocks(dump):
+            await message.author.send(block)
+
+# Splits text into code blocks that fit in one message, at line breaks where possible
+def codeBlocks(text, limit=1990):
+    blocks = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit - 7:
+            if current:
+                blocks.append(current)
+                current = ''
+            blocks.append(line[:limit - 7])
+            line = line[limit - 7:]
+        if current and len(current) + len(line) + 8 > limit:
+            blocks.append(current)
+            current = ''
+        current = current + '\n' + line if current else line
+    if current:
+        blocks.append(current)
+    return [ '```{0}```'.format(block) for block in blocks ]
+
+async def forwardMessage(message):
+    p = DictionaryReader.forGuild(message.guild)
     roles = message.author.roles
     canSend = False
     for role in roles:
@@ -183,12 +377,12 @@ async def forwardMessage(message):
             await message.channel.send('Invalid Message, {0.mention}'.format(message.author))
 
 async def itemMessage(message):
-    p = DictionaryReader()
+    p = DictionaryReader.forGuild(message.guild)
     msg = p.itemReader(message.content[1::])
     await message.channel.send(msg)
     
 async def sendWelcomeMessage(member):
-    p = DictionaryReader()
+    p = DictionaryReader.forGuild(member.guild)
     msg = p.commandReader('help')
     await member.send(msg)
     
@@ -213,7 +407,7 @@ async def sendPinMessages(message):
         count += 1
 
 async def generalMessage(message):
-    p = DictionaryReader()
+    p = DictionaryReader.forGuild(message.guild)
     try:
         roles = len(message.author.roles)
     except Exception:
@@ -238,10 +432,7 @@ async def generalMessage(message):
         else:
             await message.channel.send(msg)
     else:
-        if not isinstance(message.channel, DMChannel):
-            msg = p.commandReader(message.content[1::],message.channel.name)
-        else:
-            msg = p.commandReader(message.content[1::],'PM')
+        msg = p.invalidReply(message.content[1::])
         print(message.content[1::])
         print(msg)
         await message.author.send(msg)        
@@ -251,7 +442,7 @@ async def generalMessage(message):
             print('Error deleting message, probably from whisper')
 
 async def adminControl(message):
-    p = DictionaryReader()
+    p = DictionaryReader.forGuild(message.guild)
     roles = message.author.roles
     canBan = False
     for role in roles:
@@ -307,4 +498,13 @@ async def adminControl(message):
                     await message.author.send('-> User {0.target} was **unbanned** by {0.user}({0.user.id}) on {0.created_at} (UTC)'.format(entry))                    
             if not isUserBanned:
                 await message.author.send('User was never banned.')
-client.run(Key().value())
+
+# Called by priestBot.py. Running this file directly still works, but then the
+# spawned moderation worker re-runs all of it, client included, before it starts
+def main():
+    moderation.start()
+    client.run(Key().value())
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,65 @@
+import discord
+
+class ClientProfile:
+
+    # How much discord.py caches. The stream handlers need presences and the members
+    # who are online, the reconciliation passes ask for the full member list when they
+    # run (RoleHandler.allMembers) and the reaction handlers fetch members they don't
+    # have. Reactions arrive through on_raw_reaction_*, so the message cache only
+    # serves on_message_edit, which is not fired for messages that are no longer cached.
+    #
+    #   full     discord.py defaults with every intent, what the bot used to run with
+    #   lean     only the events the handlers use, members seen since startup, small
+    #            message cache. Leaves of members not seen since startup aren't logged
+    #   minimal  no presences or message cache, stream announcements and edit logs stop
+    #
+    # members: 'all' chunks every guild at startup. 'seen' doesn't, large guilds then
+    # start with the members who are online and add whoever comes online or joins
+    profiles = {
+        'full':    { 'maxMessages': 1000, 'presences': True,  'members': 'all' },
+        'lean':    { 'maxMessages': 250,  'presences': True,  'members': 'seen' },
+        'minimal': { 'maxMessages': None, 'presences': False, 'members': 'all' }
+    }
+
+    defaultProfile = 'lean'
+
+    def intents(name):
+        settings = ClientProfile.profiles[name]
+        if name == 'full':
+            return discord.Intents.all()
+
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.members = True
+        intents.bans = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.guild_reactions = True
+        intents.presences = settings['presences']
+        return intents
+
+    # Keyword arguments for discord.Client
+    def options(name=None):
+        if name not in ClientProfile.profiles:
+            name = ClientProfile.defaultProfile
+        settings = ClientProfile.profiles[name]
+
+        options = { 'max_messages': settings['maxMessages'] }
+        chunk = settings['members'] == 'all'
+
+        # Intents and member cache flags came with discord.py 1.5. Older versions
+        # can't skip offline members, so they always load everyone
+        if not hasattr(discord, 'Intents'):
+            options['fetch_offline_members'] = True
+            return options
+
+        intents = ClientProfile.intents(name)
+        options['intents'] = intents
+        options['chunk_guilds_at_startup'] = chunk
+
+        # Voice states are never used
+        if name != 'full':
+            flags = discord.MemberCacheFlags.from_intents(intents)
+            flags.voice = False
+            options['member_cache_flags'] = flags
+        return options
@@ -1,24 +1,85 @@
 # -*- coding: utf-8 -*-
 
 import json
-import requests
+import os
+from collections import ChainMap
 from botkey import Key
+from guildConfig import GuildConfig
+from fuzzyIndex import FuzzyIndex
 
 class DictionaryReader:
+
+    # dictEntries.txt is parsed once and shared, it is only read again when the file changes
+    entries = {}
+    entriesTime = None
+    index = None
+
+    # guild id -> (overrides, global index it was built with, index over the merged names),
+    # only for guilds with overrides. A new overrides dict from GuildConfig or a reloaded
+    # dictEntries.txt makes the entry stale
+    guildIndexes = {}
+
+    # Entries that hold bot settings instead of command replies, never suggested to users
+    settingKeys = [ 'whisper', 'roles', 'donor', 'authorized', 'logchannels', 'sentcommands', 'subscriptionchannel',
+                    'validsubscriptions', 'newssubscriptionadd', 'newssubscriptionremove', 'invalid' ]
+
+    # Always read from dictEntries.txt, a guild can't override them: the bot admins
+    # gate !update and friends for every guild, and the client is built before any guild is known
+    processKeys = [ 'authorized', 'memoryProfile' ]
     
-    def __init__(self):
+    def __init__(self, guildId=None):
         self.file = 'dictEntries.txt'
         self.dictionary = {}
         self.loadDict()
         self.loop = 0
+        self.guildId = guildId
+
+        # Guild specific entries take precedence, the global file is the fallback
+        if guildId is not None:
+            self.dictionary = ChainMap(GuildConfig.overrides(guildId), self.dictionary)
+
+    def forGuild(guild):
+        return DictionaryReader(guild.id if guild else None)
         
     def loadDict(self):
         try:
-            with open(self.file, 'r') as f:
-                s = f.read()
-                self.dictionary = json.loads(s)
+            modified = os.stat(self.file).st_mtime
+            if modified != DictionaryReader.entriesTime:
+                with open(self.file, 'r') as f:
+                    s = f.read()
+                    DictionaryReader.entries = json.loads(s)
+                DictionaryReader.entriesTime = modified
+                self.dictionary = DictionaryReader.entries
+                DictionaryReader.index = FuzzyIndex(self.commandNames())
         except Exception:
-            return
+            print('Could not load {0}'.format(self.file))
+        self.dictionary = DictionaryReader.entries
+
+    # Commands as users type them, 'link.shadow.faq' -> 'link shadow faq'. Only names that
+    # come back out of fixEntry as an entry are kept, 'link shadow guide' turns into
+    # link.artifact.guide and would be suggested without ever working
+    def commandNames(self):
+        names = []
+        for key in self.dictionary:
+            if key in DictionaryReader.settingKeys or key.endswith('.invalid'):
+                continue
+            try:
+                if self.fixEntry(key) in self.dictionary:
+                    names.append(key.replace('.', ' '))
+            except (TypeError, AttributeError):
+                continue
+        return names
+
+    # The guild's commands exist only in the merged dictionary, so guilds with overrides get their own index
+    def fuzzyIndex(self):
+        overrides = GuildConfig.overrides(self.guildId) if self.guildId is not None else None
+        if not overrides or DictionaryReader.index is None:
+            return DictionaryReader.index
+        cached = DictionaryReader.guildIndexes.get(self.guildId)
+        if cached is None or cached[0] is not overrides or cached[1] is not DictionaryReader.index:
+            cached = (overrides, DictionaryReader.index, FuzzyIndex(self.commandNames()))
+            DictionaryReader.guildIndexes[self.guildId] = cached
+        return cached[2]
 
     def whisperCommands(self):
         return self.dictionary["whisper"]
@@ -70,6 +131,16 @@ class DictionaryReader:
         
     def currentlyStreamingRole(self):
         return str(self.dictionary["currentlyStreamingRole"])
+
+    def reconcileSubscriptionRemovals(self):
+        return bool(self.dictionary.get("reconcileSubscriptionRemovals", False))
+
+    # Overrides for RaidDetector.defaults
+    def raidDetection(self):
+        return self.dictionary.get("raidDetection", {})
+
+    def memoryProfile(self):
+        return self.dictionary.get("memoryProfile")
         
     def readEntry(self, entry, channelName):
         self.loop = self.loop + 1
@@ -106,13 +177,26 @@ class DictionaryReader:
             while fixed in self.dictionary:
                 fixed = self.dictionary[fixed]
             return fixed
-        else:
-            print(entry.split('.')[0]+".invalid")
-            entryText = entry.split('.')[0] if isinstance(entry, str) else ''
-            chName = channelName if isinstance(channelName, str) else ''
-            return self.readEntry(entryText+"."+chName,chName)
+        elif channelName:
+            # Commands without arguments default to the channel they were used in, !stats in #shadow -> stats.shadow
+            return self.readEntry(entry.split('.')[0]+"."+channelName, '')
+        return None
+
+    # Reply for a command that isn't in the dictionary: the usage text for that
+    # command, with the closest known command when there is one
+    def invalidReply(self, params):
+        fixed = self.fixEntry('.'.join(params.split(' ')))
+        usage = self.dictionary.get(fixed.split('.')[0]+'.invalid', self.dictionary.get('invalid', ''))
+        # Compared as typed, the index holds names as users type them too
+        typed = ' '.join(params.lower().split())
+        index = self.fuzzyIndex()
+        suggestion = index.closest(typed) if index else None
+        if suggestion is None:
+            return usage
+        return 'Did you mean ``{0}{1}``?\n{2}'.format(Key().prefix(), suggestion, usage)
     
     def getcharstats(self,name,realm,zone):
+        import requests
         zone = zone.lower()
         locales = {"us":"en_US","eu":"en_GB","kr":"ko_KR","tw":"zh_TW"}
         locale = locales[zone]
@@ -137,6 +221,7 @@ class DictionaryReader:
         return [charint,charcrit,charhaste,charmastery,charvers,blelfworg,taurdwarf,drape]
         
     def getShadowCharStats(self,name,realm,zone):
+        import requests
         zone = zone.lower()
         locales = {"us":"en_US","eu":"en_GB","kr":"ko_KR","tw":"zh_TW"}
         try:
@@ -261,8 +346,9 @@ class DictionaryReader:
     def itemReader(self, params):
         self.loop = 0
         result = self.commandReader(params)
-        if 'Invalid' in result:
-            itemId = params.split(' ')[1]
-            if itemId.isdigit():
-                return 'https://wowhead.com/item='+itemId
+        if result is None:
+            command = params.split(' ')
+            if len(command) > 1 and command[1].isdigit():
+                return 'https://wowhead.com/item='+command[1]
+            return self.invalidReply(params)
         return result
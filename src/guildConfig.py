@@ -0,0 +1,48 @@
+import json
+import os
+
+class GuildConfig:
+
+    # One JSON file per guild, holding only the entries that differ from dictEntries.txt
+    directory = 'guilds'
+
+    # guild id -> overrides, filled on first use and dropped by invalidate
+    cache = {}
+
+    def path(guildId):
+        return os.path.join(GuildConfig.directory, '{0}.json'.format(guildId))
+
+    def overrides(guildId):
+        entries = GuildConfig.cache.get(guildId)
+        if entries is None:
+            try:
+                with open(GuildConfig.path(guildId), 'r') as f:
+                    entries = json.loads(f.read())
+            except FileNotFoundError:
+                entries = {}
+            except ValueError:
+                print('Invalid config for guild {0}, using defaults'.format(guildId))
+                entries = {}
+            GuildConfig.cache[guildId] = entries
+        return entries
+
+    def invalidate(guildId=None):
+        if guildId is None:
+            GuildConfig.cache.clear()
+        else:
+            GuildConfig.cache.pop(guildId, None)
+
+    def set(guildId, key, value):
+        entries = dict(GuildConfig.overrides(guildId))
+        if value is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = value
+
+        os.makedirs(GuildConfig.directory, exist_ok=True)
+        temp = GuildConfig.path(guildId) + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(json.dumps(entries, indent=4))
+        os.replace(temp, GuildConfig.path(guildId))
+
+        GuildConfig.invalidate(guildId)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# Offline statistics over the chat logs written by PriestLogger.
+# Every rotated file (plain or .gz) is streamed line by line in its own worker
+# process and only the per file counters come back to be merged, so memory use
+# depends on the number of channels and authors, not on the size of the logs.
+#
+# Usage:  python logAnalytics.py [--top N] [--workers N] <log directory or files>...
+
+import argparse
+import datetime
+import glob
+import gzip
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+# 2018-07-30 12:34:56,789 - general - Name(118461244784115713) : (473692943736242188) content
+# The name is matched lazily, content can itself contain "(id) : (id)"
+lineFormat = re.compile(r'^(\d{4}-\d{2}-\d{2}) (\d{2}):\d{2}:\d{2},\d+ - (\S+) - (.*?)\((\d+)\) : \((\d+)\) (.*)$')
+
+weekdays = [ 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun' ]
+
+class LogStats:
+
+    def __init__(self):
+        self.messages = Counter()
+        self.edits = Counter()
+        self.authors = Counter()
+        self.names = {}
+        # weekday * 24 + hour -> messages
+        self.heatmap = Counter()
+        self.lines = 0
+        self.skipped = 0
+
+    def merge(self, other):
+        self.messages.update(other.messages)
+        self.edits.update(other.edits)
+        self.authors.update(other.authors)
+        self.names.update(other.names)
+        self.heatmap.update(other.heatmap)
+        self.lines += other.lines
+        self.skipped += other.skipped
+        return self
+
+def openLog(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace', buffering=1024 * 1024)
+
+# Runs in a worker process, one file per call
+def parseFile(path):
+    stats = LogStats()
+    weekdayOf = {}
+
+    with openLog(path) as f:
+        for line in f:
+            stats.lines += 1
+            # Continuation lines of multi line messages don't start with a timestamp
+            if not line[:1].isdigit():
+                continue
+            match = lineFormat.match(line.rstrip('\n'))
+            if match is None:
+                stats.skipped += 1
+                continue
+
+            day, hour, channel, name, authorId, _, content = match.groups()
+
+            if content.startswith('edited from <'):
+                stats.edits[channel] += 1
+                continue
+
+            stats.messages[channel] += 1
+            stats.authors[authorId] += 1
+            stats.names[authorId] = name
+
+            # Rotated files hold one day, so this is parsed once or twice per file
+            if day not in weekdayOf:
+                weekdayOf[day] = datetime.datetime.strptime(day, '%Y-%m-%d').weekday()
+            stats.heatmap[weekdayOf[day] * 24 + int(hour)] += 1
+
+    return stats
+
+def findLogs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(name for name in glob.glob(os.path.join(path, 'HowToPriest*')) if os.path.isfile(name))
+        else:
+            files.append(path)
+    # Biggest first, so a large file doesn't start last and hold up the merge
+    return sorted(set(files), key=os.path.getsize, reverse=True)
+
+# Results are merged as files finish, not in submission order, so a slow file
+# doesn't hold the finished ones in memory until its turn comes
+def analyze(files, workers=None):
+    total = LogStats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [ pool.submit(parseFile, path) for path in files ]
+        for future in as_completed(futures):
+            total.merge(future.result())
+    return total
+
+def report(stats, top=15):
+    lines = []
+    messages = sum(stats.messages.values())
+    lines.append('{0} messages, {1} edits, {2} authors, {3} unparsed lines'.format(messages, sum(stats.edits.values()), len(stats.authors), stats.skipped))
+
+    lines.append('')
+    lines.append('{0:<28} {1:>10} {2:>8} {3:>10}'.format('Channel', 'Messages', 'Edits', 'Edit rate'))
+    for channel, count in stats.messages.most_common():
+        lines.append('{0:<28} {1:>10} {2:>8} {3:>9.1f}%'.format(channel, count, stats.edits[channel], 100.0 * stats.edits[channel] / count))
+
+    lines.append('')
+    lines.append('Top posters')
+    for authorId, count in stats.authors.most_common(top):
+        lines.append('{0:<40} {1:>10}'.format('{0}({1})'.format(stats.names.get(authorId, '?'), authorId), count))
+
+    # Each cell is scaled against the busiest hour
+    shades = ' .:-=+*#%@'
+    busiest = max(stats.heatmap.values()) if stats.heatmap else 1
+    lines.append('')
+    lines.append('Activity by hour (log time)')
+    lines.append('     ' + ''.join('{0:<3}'.format(hour) for hour in range(0, 24, 3)))
+    for day in range(7):
+        row = ''.join(shades[min(len(shades) - 1, stats.heatmap[day * 24 + hour] * len(shades) // (busiest + 1))] for hour in range(24))
+        lines.append('{0}  {1}'.format(weekdays[day], row))
+
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Channel activity, top posters, edit rates and hourly activity from the chat logs.')
+    parser.add_argument('paths', nargs='+', help='log directory or individual log files, .gz is read directly')
+    parser.add_argument('--top', type=int, default=15, help='number of top posters to list')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the number of cores')
+    args = parser.parse_args()
+
+    files = findLogs(args.paths)
+    if not files:
+        print('No log files found')
+        return
+
+    print(report(analyze(files, args.workers), args.top))
+
+if __name__ == '__main__':
+    main()
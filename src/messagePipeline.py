@@ -0,0 +1,112 @@
+import asyncio
+import traceback
+from collections import Counter
+
+class MessagePipeline:
+
+    # Splits the work done for a message into stages with their own limits.
+    #
+    # run()   awaits the work, with at most `concurrency` of the stage running at once.
+    #         Extra messages wait for a slot, which is the backpressure on commands.
+    #         When `backlog` calls are already running or waiting the new one is rejected.
+    # spawn() starts the work in the background so the caller never waits for it. When
+    #         `backlog` tasks of the stage are already pending the new work is dropped
+    #         and counted, so a slow backend can't pile up unbounded tasks.
+    #
+    # Dropped work is printed and counted. A handler set with onDrain() hears how much
+    # was dropped, per key, once the stage has nothing pending again.
+    #
+    # Errors in background work are printed and counted, they never reach on_message.
+    # Errors in run() are raised to the caller as before. close() lets pending work
+    # finish for a few seconds, then cancels the rest.
+    concurrency = { 'command': 8, 'admin': 2, 'report': 8, 'reactions': 2 }
+    backlog = { 'command': 64, 'admin': 4, 'report': 200, 'reactions': 50 }
+
+    def __init__(self):
+        self.semaphores = {}
+        self.pending = {}
+        self.active = Counter()
+        self.dropped = Counter()
+        self.failed = Counter()
+        # stage -> coroutine function called with (key, count) when the stage drains
+        self.drainHandlers = {}
+        # stage -> key -> work dropped since the stage last drained
+        self.undrained = {}
+
+    # Created on first use so they bind to the running loop
+    def semaphore(self, stage):
+        if stage not in self.semaphores:
+            self.semaphores[stage] = asyncio.Semaphore(MessagePipeline.concurrency.get(stage, 4))
+        return self.semaphores[stage]
+
+    def onDrain(self, stage, handler):
+        self.drainHandlers[stage] = handler
+
+    def drop(self, stage, work, queued, key):
+        work.close()
+        self.dropped[stage] += 1
+        self.undrained.setdefault(stage, Counter())[key] += 1
+        print('Dropped {0} work, {1} already queued ({2} dropped so far)'.format(stage, queued, self.dropped[stage]))
+
+    async def limited(self, stage, work):
+        async with self.semaphore(stage):
+            return await work
+
+    # Returns None without running the work if the stage is full
+    async def run(self, stage, work, key=None):
+        if self.active[stage] >= MessagePipeline.backlog.get(stage, 100):
+            self.drop(stage, work, self.active[stage], key)
+            return None
+
+        self.active[stage] += 1
+        try:
+            return await self.limited(stage, work)
+        finally:
+            self.active[stage] -= 1
+
+    def spawn(self, stage, work, key=None):
+        tasks = self.pending.setdefault(stage, set())
+        if len(tasks) >= MessagePipeline.backlog.get(stage, 100):
+            self.drop(stage, work, len(tasks), key)
+            return None
+
+        task = asyncio.ensure_future(self.limited(stage, work))
+        tasks.add(task)
+        task.add_done_callback(lambda done: self.finished(stage, done))
+        return task
+
+    def finished(self, stage, task):
+        self.pending[stage].discard(task)
+        if not self.pending[stage] and self.undrained.get(stage):
+            lost, self.undrained[stage] = self.undrained[stage], Counter()
+            handler = self.drainHandlers.get(stage)
+            if handler is not None:
+                for key, count in lost.items():
+                    self.spawn('notice', handler(key, count))
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.failed[stage] += 1
+            print('Error in the {0} stage'.format(stage))
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    # Returns how many tasks had to be cancelled
+    async def close(self, timeout=5):
+        tasks = [ task for stage in self.pending.values() for task in stage ]
+        if not tasks:
+            return 0
+        _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        if unfinished:
+            print('Cancelled {0} pipeline tasks still pending after {1}s'.format(len(unfinished), timeout))
+        return len(unfinished)
+
+    def report(self):
+        lines = []
+        for stage in sorted(set(MessagePipeline.concurrency) | set(self.pending)):
+            lines.append('{0:<10} pending {1:>4}  active {2:>4}  dropped {3:>6}  failed {4:>6}'.format(
+                stage, len(self.pending.get(stage, ())), self.active[stage], self.dropped[stage], self.failed[stage]))
+        return '\n'.join(lines)
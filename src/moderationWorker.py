@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from dict import DictionaryReader
+from priestLogger import PriestLogger
+
+# Entry point of the worker process. Message logging and toxicity scoring
+# both block (disk and the Perspective API), so they run here instead of on
+# the gateway event loop. Warnings are sent back through results to be posted.
+def workerMain(tasks, results, stopping):
+    from perspectiveHandler import PerspectiveHandler
+
+    logger = PriestLogger()
+    toxicity = PerspectiveHandler()
+
+    # Build the Perspective service up front, the gateway isn't waiting on us
+    try:
+        toxicity.getService()
+    except Exception as e:
+        print('Moderation worker could not build the Perspective service: {0}'.format(e))
+
+    # Checked between tasks, so stopping only waits for the task in progress.
+    # Whatever is still queued is left for the next worker
+    while not stopping.is_set():
+        try:
+            task = tasks.get(True, 1.0)
+        except queue.Empty:
+            continue
+        kind = task[0]
+
+        try:
+            if kind == 'log':
+                logger.log(task[1])
+            elif kind == 'edit':
+                logger.logEdit(task[1], task[2])
+            elif kind == 'measure':
+                warning = toxicity.measure(task[1])
+                if warning is not None:
+                    results.put(('alert', task[1]['guildId'], warning))
+        except Exception as e:
+            print('Moderation worker failed on {0}: {1}'.format(kind, e))
+
+class ModerationWorker:
+
+    def __init__(self):
+        # spawn instead of fork, so the worker doesn't inherit the gateway
+        # socket and event loop, and behaves the same on Windows and Linux
+        self.context = multiprocessing.get_context('spawn')
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = None
+        self.supervisor = None
+        self.restarts = 0
+        self.started = None
+        # Any worker exits when this is set, there is no per worker stop message to lose
+        self.stopping = self.context.Event()
+        self.lock = None
+
+    # Only called while no worker is alive, so one process at most reads the queue
+    def start(self):
+        self.stopping.clear()
+        self.started = time.time()
+        self.process = self.context.Process(target=workerMain, args=(self.tasks, self.results, self.stopping), name='PriestPyModeration', daemon=True)
+        self.process.start()
+
+    # Asks the worker to exit after its current task and waits up to `timeout` seconds.
+    # Returns False if it's still busy, a hanging Perspective call for example. It isn't
+    # terminated: that could leave it holding the queue's read lock, and the next worker
+    # would then block on the queue forever. The supervisor replaces it once it exits.
+    def stop(self, timeout=30):
+        if self.process is None or not self.process.is_alive():
+            return True
+        self.stopping.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            print('Moderation worker did not stop within {0}s'.format(timeout))
+            return False
+        return True
+
+    # restart() and the supervisor both replace the worker under this lock.
+    # Created on first use so it binds to the running loop
+    def guard(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    # Replaces the worker so it runs the code currently on disk. Tasks sent
+    # meanwhile wait in the queue for the new worker. Returns False if the old
+    # worker didn't stop in time, it's then replaced when it exits
+    async def restart(self, loop):
+        async with self.guard():
+            stopped = await loop.run_in_executor(None, self.stop)
+            if stopped:
+                self.start()
+            return stopped
+
+    def log(self, message):
+        self.tasks.put(('log', PriestLogger.record(message)))
+
+    def logEdit(self, before, after):
+        self.tasks.put(('edit', PriestLogger.record(before), PriestLogger.record(after)))
+
+    def measure(self, message):
+        self.tasks.put(('measure', PriestLogger.record(message)))
+
+    # Called once from on_ready
+    def attach(self, client):
+        self.supervisor = client.loop.create_task(self.supervise(client))
+
+    # Restarts the worker if it dies and posts the warnings it sends back.
+    # The backoff only grows while the worker keeps dying soon after starting
+    async def supervise(self, client, stable=600):
+        from discord import HTTPException
+        loop = client.loop
+
+        while not client.is_closed():
+            if not self.guard().locked() and not self.process.is_alive():
+                if time.time() - self.started >= stable:
+                    self.restarts = 0
+                self.restarts += 1
+                print('Moderation worker exited with code {0}, restarting ({1})'.format(self.process.exitcode, self.restarts))
+                await asyncio.sleep(min(60, 2 ** min(self.restarts, 6)))
+                async with self.guard():
+                    # !update may have started one during the backoff
+                    if not self.process.is_alive():
+                        self.start()
+
+            try:
+                kind, guildId, text = await loop.run_in_executor(None, self.results.get, True, 1.0)
+            except queue.Empty:
+                continue
+
+            if kind == 'alert':
+                p = DictionaryReader(guildId)
+                try:
+                    await client.get_channel(int(p.perspectiveLogChannelH2P())).send(text)
+                except HTTPException:
+                    print('Error sending toxicity warning')
@@ -1,7 +1,5 @@
 from dict import DictionaryReader
-from googleapiclient import discovery
 from botkey import Key
-from discord import TextChannel
 import json
 import logging
 
@@ -14,12 +12,23 @@ class PerspectiveHandler:
         self.analyze_request = {'comment': { 'text': 'friendly greetings from python' }, 'requestedAttributes': {'SEVERE_TOXICITY': {}} }
         self.attributesBase = '"{0}": {{}},'        
         self.defaultAttributes = [ 'SEVERE_TOXICITY' ]
-
-    async def measure(self, client, message):
-        p = DictionaryReader()
-        service = discovery.build('commentanalyzer', 'v1alpha1', developerKey=Key().perspectiveApiKey())
+        self.service = None
+
+    # googleapiclient is slow to import and build, so the service is created
+    # on first use and reused afterwards. The moderation worker builds it as
+    # soon as it starts
+    def getService(self):
+        if self.service is None:
+            from googleapiclient import discovery
+            self.service = discovery.build('commentanalyzer', 'v1alpha1', developerKey=Key().perspectiveApiKey())
+        return self.service
+
+    # Blocking, runs inside the moderation worker process.
+    # Returns the warning to post, or None if the message is fine
+    def measure(self, record):
+        service = self.getService()
         
-        body = self.buildRequest(message.content, self.buildAttributes(self.defaultAttributes))
+        body = self.buildRequest(record['content'], self.buildAttributes(self.defaultAttributes))
 
         #print(json.dumps(body, indent=2))
 
@@ -30,10 +39,10 @@ class PerspectiveHandler:
         if response is not None:            
             score = response['attributeScores']['SEVERE_TOXICITY']['summaryScore']['value']
 
-            source = message.channel.name if isinstance(message.channel, TextChannel) else 'PM'        
-
             if float(score) > 0.90:
-                await client.get_channel(int(p.perspectiveLogChannelH2P())).send('Toxic Message Warning - {0:.2g}% Toxicity - on {2} from {1.author}({1.author.id})```{1.content}```'.format(score * 100.0, message, source))
+                return 'Toxic Message Warning - {0:.2g}% Toxicity - on {1[channel]} from {1[author]}({1[authorId]})```{1[content]}```'.format(score * 100.0, record)
+
+        return None
 
     # Creates a JSON with all attributes requested
     def buildAttributes(self, attributes):
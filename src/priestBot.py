@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+# Starts the bot: python priestBot.py
+#
+# The moderation worker is a spawned process, and a spawned process first re-runs
+# the main module of its parent. Everything here is under the guard, so the worker
+# only imports what it uses instead of discord, the client and the other handlers.
+if __name__ == '__main__':
+    import basic_bot
+    basic_bot.main()
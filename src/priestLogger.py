@@ -4,8 +4,6 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 from time import sleep
 import string
-import sqlite3
-from discord import TextChannel
 from os import path
 
 class PriestLogger:
@@ -27,16 +25,29 @@ class PriestLogger:
      #   if not path.exists(self.dbFile):
        #     self.createDb()
         
-    def log(self, message):
+    # Discord objects can't cross the process boundary to the moderation
+    # worker, so messages are flattened into plain dicts first. discord is
+    # imported here so the worker process, which never calls this, doesn't load it
+    def record(message):
+        from discord import TextChannel
+        return {
+            'guildId': message.guild.id if message.guild else None,
+            'channel': message.channel.name if isinstance(message.channel, TextChannel) else 'PM',
+            'author': str(message.author),
+            'authorName': message.author.name,
+            'authorId': message.author.id,
+            'id': message.id,
+            'content': message.content
+        }
+
+    def log(self, record):
         self.logHandler.acquire()        
-        channelName = message.channel.name if isinstance(message.channel, TextChannel) else 'PM'
-        self.logger.info('{0} - {1.author.name}({1.author.id}) : ({1.id}) {1.content}'.format(channelName, message))        
+        self.logger.info('{0[channel]} - {0[authorName]}({0[authorId]}) : ({0[id]}) {0[content]}'.format(record))        
         self.logHandler.release()
         
     def logEdit(self, before, after):
         self.logHandler.acquire()        
-        channelName = before.channel.name if isinstance(before.channel, TextChannel) else 'PM'        
-        self.logger.info('{0} - {1.author.name}({1.author.id}) : ({1.id}) edited from <{1.content}> to <{2.content}>'.format(channelName, before, after))
+        self.logger.info('{0[channel]} - {0[authorName]}({0[authorId]}) : ({0[id]}) edited from <{0[content]}> to <{1[content]}>'.format(before, after))
         self.logHandler.release()
       
     def createDb(self):
@@ -53,6 +64,7 @@ class PriestLogger:
     
     def cursor(self):
         if not self.c:
+            import sqlite3
             self.conn = sqlite3.connect(self.dbFile)
             self.c = self.conn.cursor()
         return self.c
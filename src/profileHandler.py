@@ -0,0 +1,101 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+class ProfileHandler:
+
+    # Nothing runs until an admin asks for a profile: the sampler is a thread that
+    # exists only for the requested seconds and tracemalloc is stopped again after.
+    running = False
+
+    # Top frames of an event loop waiting for I/O. Those samples are idle time, they're
+    # counted separately and left out of the hotspots
+    idleFrames = { ('selectors.py', 'select'), ('windows_events.py', 'select') }
+
+    # Samples the stack of the event loop thread every `interval` seconds. Returns
+    # (busy samples, idle samples, counts per line, counts per function anywhere on the stack)
+    def sample(threadId, seconds, interval):
+        own = Counter()
+        cumulative = Counter()
+        samples = 0
+        idle = 0
+
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            frame = sys._current_frames().get(threadId)
+            if frame is not None and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in ProfileHandler.idleFrames:
+                idle += 1
+            elif frame is not None:
+                samples += 1
+                own[(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)] += 1
+                seen = set()
+                while frame is not None:
+                    key = (frame.f_code.co_filename, frame.f_code.co_name)
+                    if key not in seen:
+                        seen.add(key)
+                        cumulative[key] += 1
+                    frame = frame.f_back
+            time.sleep(interval)
+
+        return samples, idle, own, cumulative
+
+    def location(filename, name, line=None):
+        if line is None:
+            return '{0}:{1}'.format(os.path.basename(filename), name)
+        return '{0}:{1} {2}'.format(os.path.basename(filename), line, name)
+
+    # Runs the profile and returns the report, split into messages that fit in a DM
+    async def profile(client, seconds, memory, caches, top=8, interval=0.005):
+        if ProfileHandler.running:
+            return [ 'A profile is already running.' ]
+        ProfileHandler.running = True
+
+        startedTracing = False
+        try:
+            if memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                startedTracing = True
+            before = tracemalloc.take_snapshot() if memory else None
+
+            threadId = threading.get_ident()
+            samples, idle, own, cumulative = await client.loop.run_in_executor(None, ProfileHandler.sample, threadId, seconds, interval)
+
+            after = tracemalloc.take_snapshot() if memory else None
+        finally:
+            if startedTracing:
+                tracemalloc.stop()
+            ProfileHandler.running = False
+
+        sections = []
+
+        # Percentages below are of the busy samples only
+        lines = [ 'CPU: {0} busy and {1} idle samples over {2}s ({3:.1f}% busy)'.format(samples, idle, seconds, 100.0 * samples / max(samples + idle, 1)) ]
+        lines.append('Hottest lines:')
+        for (filename, line, name), count in own.most_common(top):
+            lines.append('  {0:5.1f}% {1}'.format(100.0 * count / max(samples, 1), ProfileHandler.location(filename, name, line)))
+        # Frames present in every sample (the event loop itself) say nothing, so they're left out
+        lines.append('On the stack:')
+        busiest = [ entry for entry in cumulative.most_common() if entry[1] < samples ][:top]
+        for (filename, name), count in busiest:
+            lines.append('  {0:5.1f}% {1}'.format(100.0 * count / max(samples, 1), ProfileHandler.location(filename, name)))
+        sections.append('\n'.join(lines))
+
+        if memory:
+            lines = [ 'Memory growth over {0}s:'.format(seconds) ]
+            for stat in after.compare_to(before, 'lineno')[:top]:
+                frame = stat.traceback[0]
+                lines.append('  {0:+9.1f}KB {1:>+7} objects {2}:{3}'.format(stat.size_diff / 1024, stat.count_diff, os.path.basename(frame.filename), frame.lineno))
+            sections.append('\n'.join(lines))
+
+        lines = [ 'Caches:' ]
+        for name, count in caches.items():
+            lines.append('  {0:<24} {1:>10}'.format(name, count))
+        lines.append('  {0:<24} {1:>10}'.format('gc objects', len(gc.get_objects())))
+        sections.append('\n'.join(lines))
+
+        return [ '```{0}```'.format(section) for section in sections ]
@@ -0,0 +1,193 @@
+import asyncio
+import io
+import time
+import zlib
+from collections import Counter
+from collections import deque
+from discord import File
+from discord import HTTPException
+from dict import DictionaryReader
+
+class RaidDetector:
+
+    # Watches join rate, per author message rate and repeated content per guild in
+    # sliding windows.
+    #
+    # Guild wide raid mode only comes from a burst of joins or from the same message
+    # posted by several different members. While it lasts the bot skips welcome DMs,
+    # join logs and toxicity checks, and staff get one summary when it starts and one
+    # when it ends, listing every member who joined meanwhile.
+    #
+    # A single member flooding only stops scoring for that member's messages, and
+    # staff are told who it is, so flooding can't be used to switch scoring off unnoticed.
+    #
+    # The limits below can be overridden per guild with a "raidDetection" dictionary entry.
+    # They're read once per guild between expire() runs, not on every message.
+    defaults = {
+        'joinLimit': 10,            # joins ...
+        'joinWindow': 10,           # ... within this many seconds
+        'messageLimit': 6,          # messages from one member ...
+        'messageWindow': 5,         # ... within this many seconds
+        'floodLength': 60,          # seconds a flooding member stays unscored after the last burst
+        'duplicateAuthors': 4,      # different members posting the same message ...
+        'duplicateWindow': 30,      # ... within this many seconds
+        'duplicateMinLength': 10,   # shorter messages, like "gg", are never compared
+        'raidLength': 300,          # seconds raid mode lasts after the last trigger
+        'recentSize': 500           # messages kept per guild for the duplicate check
+    }
+
+    # Joined members are mentioned in the summary up to this many, longer lists are attached as a file
+    inlineMembers = 40
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+        # guild id -> last joinLimit join times
+        self.joins = {}
+        # (guild id, author id) -> last messageLimit message times
+        self.authors = {}
+        # (guild id, author id) -> time the flood ends
+        self.floods = {}
+        # guild id -> (time, content hash, author id) of recent messages,
+        # and which authors posted each hash in there
+        self.recent = {}
+        self.recentAuthors = {}
+
+        # guild id -> state of the raid in progress
+        self.raids = {}
+        # (guild id, text, member ids to list)
+        self.notices = []
+        self.watcher = None
+
+        # guild id -> limits, cleared by expire() so config changes apply within seconds
+        self.limitCache = {}
+
+    def limits(self, guildId):
+        limits = self.limitCache.get(guildId)
+        if limits is None:
+            limits = dict(RaidDetector.defaults)
+            limits.update(DictionaryReader(guildId).raidDetection())
+            self.limitCache[guildId] = limits
+        return limits
+
+    # Whitespace and case are ignored, so trivially varied spam still collides
+    def normalize(content):
+        return ' '.join(content.lower().split())
+
+    # Returns True if the join happened during a raid and shouldn't be welcomed or logged
+    def join(self, guildId, memberId, now=None):
+        now = now if now is not None else time.time()
+        limits = self.limits(guildId)
+
+        times = self.joins.get(guildId)
+        if times is None or times.maxlen != limits['joinLimit']:
+            times = self.joins[guildId] = deque(times or (), maxlen=limits['joinLimit'])
+        times.append(now)
+        if len(times) == times.maxlen and now - times[0] <= limits['joinWindow']:
+            self.trip(guildId, now, limits, '{0} joins in {1:.0f}s'.format(len(times), now - times[0]))
+
+        raid = self.raids.get(guildId)
+        if raid is None:
+            return False
+        raid['members'].append(memberId)
+        return True
+
+    # Returns True if the message shouldn't be scored, because of a raid or because its author is flooding
+    def message(self, guildId, authorId, content, now=None):
+        if guildId is None:
+            return False
+        now = now if now is not None else time.time()
+        limits = self.limits(guildId)
+        key = (guildId, authorId)
+
+        times = self.authors.get(key)
+        if times is None or times.maxlen != limits['messageLimit']:
+            times = self.authors[key] = deque(times or (), maxlen=limits['messageLimit'])
+        times.append(now)
+        if len(times) == times.maxlen and now - times[0] <= limits['messageWindow']:
+            if key not in self.floods:
+                self.notices.append((guildId, '<@{0}> sent {1} messages in {2:.0f}s, their messages are not scored for now.'.format(authorId, len(times), now - times[0]), None))
+            self.floods[key] = now + limits['floodLength']
+
+        text = RaidDetector.normalize(content or '')
+        if len(text) >= limits['duplicateMinLength'] and not text.startswith(self.prefix):
+            self.checkDuplicate(guildId, authorId, text, now, limits)
+
+        raid = self.raids.get(guildId)
+        if raid is not None:
+            raid['messages'] += 1
+            return True
+        return key in self.floods
+
+    def checkDuplicate(self, guildId, authorId, text, now, limits):
+        recent = self.recent.setdefault(guildId, deque())
+        authors = self.recentAuthors.setdefault(guildId, {})
+        while recent and (len(recent) >= limits['recentSize'] or now - recent[0][0] > limits['duplicateWindow']):
+            _, old, oldAuthor = recent.popleft()
+            authors[old][oldAuthor] -= 1
+            if not authors[old][oldAuthor]:
+                del authors[old][oldAuthor]
+            if not authors[old]:
+                del authors[old]
+
+        digest = zlib.crc32(text.encode('utf-8'))
+        recent.append((now, digest, authorId))
+        posters = authors.setdefault(digest, Counter())
+        posters[authorId] += 1
+        if len(posters) >= limits['duplicateAuthors']:
+            self.trip(guildId, now, limits, 'the same message from {0} members in {1}s'.format(len(posters), limits['duplicateWindow']))
+
+    def trip(self, guildId, now, limits, reason):
+        raid = self.raids.get(guildId)
+        if raid is None:
+            self.raids[guildId] = { 'started': now, 'until': now + limits['raidLength'], 'reason': reason, 'members': [], 'messages': 0 }
+            self.notices.append((guildId, 'Raid mode enabled: {0}. Welcome messages, join logs and toxicity checks are paused.'.format(reason), None))
+        else:
+            raid['until'] = now + limits['raidLength']
+
+    # Ends the raids and floods that have gone quiet and drops stale rate windows
+    def expire(self, now=None):
+        now = now if now is not None else time.time()
+        self.limitCache.clear()
+
+        for guildId, raid in list(self.raids.items()):
+            if now >= raid['until']:
+                del self.raids[guildId]
+                self.notices.append((guildId, 'Raid mode ended after {0:.0f}s: skipped welcome messages and join logs for {1} members, and did not score {2} messages.'.format(
+                    now - raid['started'], len(raid['members']), raid['messages']), raid['members']))
+
+        for key, until in list(self.floods.items()):
+            if now >= until:
+                del self.floods[key]
+
+        windows = {}
+        for key, times in list(self.authors.items()):
+            if key[0] not in windows:
+                windows[key[0]] = self.limits(key[0])['messageWindow']
+            if now - times[-1] > windows[key[0]]:
+                del self.authors[key]
+
+    # Called once from on_ready
+    def attach(self, client):
+        self.watcher = client.loop.create_task(self.watch(client))
+
+    async def watch(self, client, interval=5):
+        while not client.is_closed():
+            await asyncio.sleep(interval)
+            self.expire()
+
+            notices, self.notices = self.notices, []
+            for guildId, text, members in notices:
+                p = DictionaryReader(guildId)
+                text = '['+time.strftime("%Y-%m-%d %H:%M:%S")+'] '+text
+                try:
+                    channel = client.get_channel(int(p.actionLogChannel()))
+                    if not members:
+                        await channel.send(text)
+                    elif len(members) <= RaidDetector.inlineMembers:
+                        await channel.send(text + '\nJoined: ' + ' '.join('<@{0}>'.format(member) for member in members))
+                    else:
+                        listing = io.BytesIO('\n'.join(str(member) for member in members).encode('utf-8'))
+                        await channel.send(text + '\nThe members who joined are in the attached file.', file=File(listing, 'raid-joins-{0}.txt'.format(guildId)))
+                except HTTPException:
+                    print('Error sending raid notice: {0}'.format(text))
@@ -0,0 +1,70 @@
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+class ReloadHandler:
+
+    # Reloaded in this order, so each module is imported against the fresh copies of the ones before it
+    modules = [ 'guildConfig', 'fuzzyIndex', 'dict', 'twitchHandler', 'roleUpdateQueue', 'roleHandler', 'perspectiveHandler', 'priestLogger' ]
+
+    # Runs git pull without blocking the event loop, returns (success, output)
+    async def pull():
+        process = await asyncio.create_subprocess_exec('git', 'pull',
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT)
+        output, _ = await process.communicate()
+        return process.returncode == 0, output.decode('utf-8', 'replace').strip()
+
+    # Imports fresh copies of the handler modules and points every other bot module at
+    # them. Nothing is swapped unless all imports succeed, otherwise the running code is
+    # put back and the error is raised. Runs without awaiting, so no event is handled halfway.
+    def reload():
+        old = { name: sys.modules.get(name) for name in ReloadHandler.modules }
+        importlib.invalidate_caches()
+
+        try:
+            for name in ReloadHandler.modules:
+                sys.modules.pop(name, None)
+                importlib.import_module(name)
+        except BaseException:
+            for name, module in old.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+            raise
+
+        new = { name: sys.modules[name] for name in ReloadHandler.modules }
+        source = os.path.dirname(os.path.abspath(__file__))
+
+        # Rebind names like basic_bot's DictionaryReader that still point at the old classes
+        for holder in list(sys.modules.values()):
+            location = getattr(holder, '__file__', None)
+            if holder is None or location is None or os.path.dirname(os.path.abspath(location)) != source:
+                continue
+            if holder.__name__ in new:
+                continue
+
+            for attribute, value in list(vars(holder).items()):
+                owner = getattr(value, '__module__', None)
+                if owner in new and old[owner] is not None and getattr(old[owner], getattr(value, '__name__', ''), None) is value:
+                    setattr(holder, attribute, getattr(new[owner], value.__name__, value))
+
+        return new
+
+    # Pull, then reload. Returns the message for whoever asked
+    async def update():
+        started = time.perf_counter()
+
+        pulled, output = await ReloadHandler.pull()
+        if not pulled:
+            return False, 'git pull failed, nothing was reloaded```{0}```'.format(output[-1500:])
+
+        try:
+            ReloadHandler.reload()
+        except Exception as e:
+            return False, 'Reload failed, still running the previous code```{0}: {1}```'.format(type(e).__name__, e)
+
+        return True, 'Reloaded {0} in {1:.0f}ms```{2}```'.format(', '.join(ReloadHandler.modules), (time.perf_counter() - started) * 1000, output[-1500:])
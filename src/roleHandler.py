@@ -4,10 +4,16 @@ from discord import utils
 from discord import Embed
 from discord import Colour
 from discord import ActivityType
+from discord import HTTPException
+import asyncio
 from twitchHandler import TwitchHandler
+from roleUpdateQueue import RoleUpdateQueue
 
 class RoleHandler:
 
+    # addStream posts "<mention> is now Live on Twitch!" above the stream embed
+    liveSuffix = ' is now Live on Twitch!'
+
     async def newsSubscriptionAdd(client, emoji, user_id, guild_id):
 
         if not emoji.is_custom_emoji():
@@ -22,8 +28,8 @@ class RoleHandler:
         if not role:
             return
 
-        member = guild.get_member(user_id)        
-        p = DictionaryReader()
+        member = await RoleHandler.member(guild, user_id)
+        p = DictionaryReader(guild_id)
 
         if role not in member.roles:
             await member.add_roles(role, reason='Subscribed to {0}'.format(targetRole))
@@ -44,15 +50,105 @@ class RoleHandler:
         if not role:
             return
 
-        member = guild.get_member(user_id) 
-        p = DictionaryReader()         
+        member = await RoleHandler.member(guild, user_id)
+        p = DictionaryReader(guild_id)
 
         if role in member.roles:
             await member.remove_roles(role, reason='Unsubscribed to {0}'.format(targetRole))
             await member.send(p.readEntry('newssubscriptionremove', '').format(targetRole))
 
+    # The lean memory profile only caches members seen online since startup,
+    # the others are fetched when needed and not kept
+    async def member(guild, user_id):
+        member = guild.get_member(user_id)
+        if member is None and not guild.chunked:
+            member = await guild.fetch_member(user_id)
+        return member
+
+    # Every member of the guild, without adding the uncached ones to the cache
+    async def allMembers(guild):
+        if guild.chunked:
+            return guild.members
+        members = []
+        async for member in guild.fetch_members(limit=None):
+            members.append(member)
+        return members
+
+    # Ids of the given members who are streaming right now. Fetched members carry no
+    # presence, so the ones missing from the cache are asked for with theirs
+    async def streamingIds(guild, ids):
+        live = set()
+        missing = []
+        for user_id in ids:
+            member = guild.get_member(user_id)
+            if member is None:
+                missing.append(user_id)
+            elif RoleHandler.isStreaming(member):
+                live.add(user_id)
+
+        if missing and not guild.chunked:
+            for start in range(0, len(missing), 100):
+                batch = missing[start:start + 100]
+                for member in await guild.query_members(user_ids=batch, limit=len(batch), presences=True, cache=False):
+                    if RoleHandler.isStreaming(member):
+                        live.add(member.id)
+        return live
+
+    # Catches up with reactions added or removed while the bot was offline.
+    # Reactions on the messages in the subscription channel are compared with the
+    # current holders of each *News role and only the differences are applied.
+    # !sub gives roles without a reaction, so removals only happen when enabled.
+    # Every *News role is checked, one whose reactions were all removed included.
+    async def reconcileSubscriptions(client, guild):
+        p = DictionaryReader(guild.id)
+        channelId = p.readEntry('subscriptionchannel', '')
+        channel = guild.get_channel(int(channelId)) if channelId else None
+
+        if channel is None:
+            return
+
+        # role -> ids of the members who reacted for it
+        subscribers = { role: set() for role in guild.roles if role.name.endswith('News') }
+        async for message in channel.history(limit=None):
+            for reaction in message.reactions:
+                if not reaction.custom_emoji:
+                    continue
+
+                targetRole = '{0}News'.format(reaction.emoji.name.capitalize())
+                role = utils.find(lambda r: r.name == targetRole, guild.roles)
+
+                if not role:
+                    continue
+
+                # Fetched a page of 100 users at a time
+                users = subscribers.setdefault(role, set())
+                async for user in reaction.users():
+                    if user.id != client.user.id:
+                        users.add(user.id)
+
+        members = { member.id: member for member in await RoleHandler.allMembers(guild) }
+
+        updates = RoleUpdateQueue()
+        for role, users in subscribers.items():
+            holders = set(member.id for member in members.values() if role in member.roles)
+
+            for user_id in users - holders:
+                member = members.get(user_id)
+                if member is not None:
+                    updates.add(member, role)
+
+            if p.reconcileSubscriptionRemovals():
+                for user_id in holders - users:
+                    updates.remove(members[user_id], role)
+
+        if not len(updates):
+            return
+
+        added, removed, failed = await updates.apply('Subscription reconciliation')
+        print('Subscription reconciliation on {0.name}: {1} added, {2} removed, {3} failed'.format(guild, added, removed, failed))
+
     async def newsSubscription(client, message):
-        p = DictionaryReader()
+        p = DictionaryReader.forGuild(message.guild)
 
         if not message.guild:
             return
@@ -78,7 +174,7 @@ class RoleHandler:
                 await message.author.send(p.readEntry('newssubscriptionremove', '').format(targetRole))
     
     async def toggleStream(client, message):
-        p = DictionaryReader()
+        p = DictionaryReader.forGuild(message.guild)
 
         print(message.content)
         
@@ -108,7 +204,7 @@ class RoleHandler:
                 await target.remove_roles(role, reason='Role removed by {0.name}'.format(message.author))
 
     async def toggleUserState(client, before, after):
-        p = DictionaryReader()
+        p = DictionaryReader.forGuild(before.guild)
         
         streamingRole = utils.find(lambda r: r.name == p.streamingRole(), before.guild.roles)        
          
@@ -128,7 +224,7 @@ class RoleHandler:
         # Checks if the Game state changed or if the user isn't streaming
         # This or statement might be costly and subject to improvement
         elif before.activity != after.activity or after.activity is None or after.activity.type != ActivityType.streaming:
-            p = DictionaryReader()
+            p = DictionaryReader.forGuild(after.guild)
             if after.activity is None or after.activity.type != ActivityType.streaming:
                 #print('stopped stream')
                 # Stopped Streaming                
@@ -140,8 +236,55 @@ class RoleHandler:
                 await RoleHandler.addStream(client, after)
         
         
+    def isStreaming(member):
+        return member is not None and member.activity is not None and member.activity.type == ActivityType.streaming
+
+    # Only messages shaped like addStream's are treated as announcements, other bot
+    # posts that mention someone in the channel are left alone
+    def isAnnouncement(message):
+        return message.content.endswith(RoleHandler.liveSuffix) and any('twitch.tv' in (embed.url or '') for embed in message.embeds)
+
+    # Fixes what toggleUserState missed, e.g. presence updates lost while offline.
+    # Currently Streaming is removed from everyone whose cached presence isn't a
+    # stream, and announcements (see isAnnouncement) that don't mention a live streamer are deleted.
+    # The channel history is read once per pass instead of once per member.
+    # Returns how many roles and announcements were removed.
+    async def reconcileStreams(client, guild, pace=1.0):
+        p = DictionaryReader(guild.id)
+        channel = client.get_channel(int(p.streamingBroadcastChannel()))
+        currentlyStreaming = utils.find(lambda r: r.name == p.currentlyStreamingRole(), guild.roles)
+
+        if currentlyStreaming is None:
+            return 0, 0
+
+        holders = [ member for member in await RoleHandler.allMembers(guild) if currentlyStreaming in member.roles ]
+        live = await RoleHandler.streamingIds(guild, [ member.id for member in holders ])
+
+        updates = RoleUpdateQueue(pace)
+        for member in holders:
+            if member.id not in live:
+                updates.remove(member, currentlyStreaming)
+        _, removed, _ = await updates.apply('User stopped streaming')
+
+        deleted = 0
+        if channel is not None and channel.guild == guild:
+            async for message in channel.history(limit=None):
+                if message.author != client.user or not message.mentions or not RoleHandler.isAnnouncement(message):
+                    continue
+                # Checked right now, someone may have gone live during the pass
+                if await RoleHandler.streamingIds(guild, [ member.id for member in message.mentions ]):
+                    continue
+                try:
+                    await message.delete()
+                    deleted += 1
+                except HTTPException:
+                    print('Error deleting stale stream announcement {0.id}'.format(message))
+                await asyncio.sleep(pace)
+
+        return removed, deleted
+
     async def removeStream(client, member):
-        p = DictionaryReader()
+        p = DictionaryReader.forGuild(member.guild)
         channel = client.get_channel(int(p.streamingBroadcastChannel()))
         currentlyStreaming = utils.find(lambda r: r.name == p.currentlyStreamingRole(), member.guild.roles)
                         
@@ -159,7 +302,7 @@ class RoleHandler:
                 await message.delete()
     
     async def addStream(client, member):
-        p = DictionaryReader()
+        p = DictionaryReader.forGuild(member.guild)
         channel = client.get_channel(int(p.streamingBroadcastChannel()))
         currentlyStreaming = utils.find(lambda r: r.name == p.currentlyStreamingRole(), member.guild.roles)
         
@@ -188,7 +331,7 @@ class RoleHandler:
                 
         if currentlyStreaming not in member.roles:
             await member.add_roles(currentlyStreaming, reason='User started streaming')            
-            await channel.send('{0.mention} is now Live on Twitch!'.format(member),embed=emb)
+            await channel.send('{0.mention}{1}'.format(member, RoleHandler.liveSuffix),embed=emb)
             
         else:
             # This could be slow, but shouldn't, assuming there should be few messages in the channel
@@ -0,0 +1,56 @@
+import asyncio
+from discord import HTTPException
+
+class RoleUpdateQueue:
+
+    # Collects role changes for bulk jobs and applies them one member at a time.
+    # All changes for a member go out as one add_roles and one remove_roles call.
+    #
+    # Members are updated at a fixed pace of one per `pace` seconds. It is not read
+    # from the rate limit headers, discord.py doesn't expose them for role updates,
+    # it only keeps a bulk job well below the member update limit so other requests
+    # don't queue behind it. Any 429 is still retried by discord.py itself.
+    def __init__(self, pace=1.0):
+        self.pace = pace
+        # member id -> [member, roles to add, roles to remove]
+        self.updates = {}
+
+    def __len__(self):
+        return len(self.updates)
+
+    def entry(self, member):
+        if member.id not in self.updates:
+            self.updates[member.id] = [member, set(), set()]
+        return self.updates[member.id]
+
+    def add(self, member, role):
+        entry = self.entry(member)
+        entry[2].discard(role)
+        entry[1].add(role)
+
+    def remove(self, member, role):
+        entry = self.entry(member)
+        entry[1].discard(role)
+        entry[2].add(role)
+
+    # Returns how many roles were added, removed, and how many members failed
+    async def apply(self, reason):
+        added = 0
+        removed = 0
+        failed = 0
+
+        updates, self.updates = self.updates, {}
+        for member, add, remove in updates.values():
+            try:
+                if add:
+                    await member.add_roles(*add, reason=reason)
+                    added += len(add)
+                if remove:
+                    await member.remove_roles(*remove, reason=reason)
+                    removed += len(remove)
+            except HTTPException:
+                print('Error updating roles for {0.name}'.format(member))
+                failed += 1
+            await asyncio.sleep(self.pace)
+
+        return added, removed, failed
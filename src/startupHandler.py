@@ -0,0 +1,77 @@
+import asyncio
+import sys
+import time
+
+class StartupHandler:
+
+    # Set when this module is first imported, which basic_bot does before anything else
+    startTime = time.time()
+    readyTime = None
+    warmupTimes = {}
+
+    # Integrations that are imported lazily by the handlers
+    lazyModules = [ 'googleapiclient.discovery', 'twitch', 'requests', 'sqlite3' ]
+
+    # The ones the gateway process itself uses, Perspective and sqlite live in the moderation worker
+    warmupModules = [ 'twitch', 'requests' ]
+
+    # Modules imported by the startup report subprocess
+    reportModules = [ 'dict', 'priestLogger', 'perspectiveHandler', 'roleHandler', 'twitchHandler', 'moderationWorker' ]
+
+    def markReady():
+        StartupHandler.readyTime = time.time()
+
+    # Imports the heavy integrations in a worker thread after on_ready, so the
+    # first stream announcement doesn't pay for it
+    async def warmup(client):
+        loop = client.loop
+        for module in StartupHandler.warmupModules:
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, __import__, module)
+            except ImportError:
+                print('Warmup: could not import {0}'.format(module))
+                continue
+            StartupHandler.warmupTimes[module] = time.perf_counter() - started
+
+    # Runs a fresh interpreter with -X importtime and returns the slowest
+    # imports by cumulative time, as (cumulative us, self us, module)
+    async def importTimes(limit=15):
+        statement = 'import ' + ', '.join(StartupHandler.reportModules + StartupHandler.lazyModules)
+        process = await asyncio.create_subprocess_exec(sys.executable, '-X', 'importtime', '-c', statement,
+                                                       stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.PIPE)
+        _, stderr = await process.communicate()
+
+        entries = []
+        for line in stderr.decode('utf-8', 'replace').splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue
+            entries.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+
+        entries.sort(reverse=True)
+        return entries[:limit]
+
+    async def report(client):
+        lines = []
+        if StartupHandler.readyTime is not None:
+            lines.append('Cold start to on_ready: {0:.2f}s'.format(StartupHandler.readyTime - StartupHandler.startTime))
+        lines.append('Uptime: {0:.0f}s'.format(time.time() - StartupHandler.startTime))
+        lines.append('Gateway latency: {0:.0f}ms'.format(client.latency * 1000))
+
+        lines.append('')
+        lines.append('Background warmup:')
+        if not StartupHandler.warmupTimes:
+            lines.append('  pending')
+        for name, seconds in StartupHandler.warmupTimes.items():
+            lines.append('  {0:<28} {1:8.1f}ms'.format(name, seconds * 1000))
+
+        lines.append('')
+        lines.append('Cold imports (-X importtime, cumulative/self):')
+        for cumulative, own, module in await StartupHandler.importTimes():
+            lines.append('  {0:<28} {1:8.1f}ms {2:8.1f}ms'.format(module, cumulative / 1000, own / 1000))
+
+        return '```{0}```'.format('\n'.join(lines))
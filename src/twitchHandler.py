@@ -1,9 +1,13 @@
-from twitch import TwitchClient
-
 class TwitchHandler:
 
+    # The twitch library is only needed once someone goes live, so it is
+    # imported on first use instead of at bot startup
+    def twitchClient(twitch_id):
+        from twitch import TwitchClient
+        return TwitchClient(client_id=twitch_id)
+
     async def validateStream(url, twitch_id):
-        client = TwitchClient(client_id=twitch_id)
+        client = TwitchHandler.twitchClient(twitch_id)
         channelName = url.split('/')[-1:]
         channels = client.search.channels(channelName)
         
@@ -14,7 +18,7 @@ class TwitchHandler:
         return False
         
     async def fetchStreamInfo(url, twitch_id):
-        client = TwitchClient(client_id=twitch_id)
+        client = TwitchHandler.twitchClient(twitch_id)
         channelName = url.split('/')[-1:]
         channels = client.search.channels(channelName)
         